@@ -1,10 +1,9 @@
 # main.py
 
-import argparse, sys, json
+import argparse, sys
 from scripts.script_validator import load_config, validate
-from scripts.generate_chat    import save_images
+from scripts.generate_chat    import save_images, load_json
 from scripts.compile_images   import compile_video
-from scripts.sound_effects    import main as sound_main
 
 def main():
     p = argparse.ArgumentParser()
@@ -14,26 +13,17 @@ def main():
     args = p.parse_args()
 
     cfg   = load_config(args.config)
-    convo = json.load(open(args.conversation, encoding='utf8'))
+    convo = load_json(args.conversation)
 
     errs = validate(convo, cfg)
     if errs:
         print("Validation failed:", *errs, sep="\n - ")
         sys.exit(1)
 
-    save_images(cfg, convo, json.load(open(args.characters, encoding='utf8')))
+    save_images(cfg, convo, load_json(args.characters))
+    # encodes the frames and mixes in the sounds in one pass
     compile_video(cfg, convo)
 
-    # mix in sounds
-    sound_main_args = [
-      '--config',       args.config,
-      '--conversation', args.conversation,
-      '--input-video',  cfg['paths']['ffmpeg_output'],
-      '--output-video', cfg['paths']['final_video']
-    ]
-    # you can invoke sound_main via subprocess if needed, or adapt its signature
-    sound_main()
-
     print("✅ All done! Final video at", cfg['paths']['final_video'])
 
 if __name__=='__main__':
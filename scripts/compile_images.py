@@ -1,43 +1,186 @@
 # scripts/compile_images.py
 
-import os, json, subprocess
+import os, json, subprocess, threading
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+try:
+    from scripts.sound_effects import collect_audio_events, audio_inputs, audio_filter_script
+except ImportError:  # run directly as scripts/compile_images.py
+    from sound_effects import collect_audio_events, audio_inputs, audio_filter_script
+
+# H.264 encoders, fastest first, with flags giving roughly libx264 -crf 25
+ENCODERS = [
+    ('h264_nvenc',        ['-preset', 'p4', '-cq', '25', '-b:v', '0', '-pix_fmt', 'yuv420p']),
+    ('h264_qsv',          ['-global_quality', '25', '-pix_fmt', 'nv12']),
+    ('h264_videotoolbox', ['-q:v', '60', '-pix_fmt', 'yuv420p']),
+    ('libx264',           ['-crf', '25', '-pix_fmt', 'yuv420p']),
+]
+
+FPS = 25
+
+# conversations shorter than two parts of this many events encode in one pass
+PART_MIN_EVENTS = 50
+# consumer GPU drivers allow only a few encode sessions at once
+HW_MAX_PARTS = 2
 
 def load_config(path):
-    cfg = json.load(open(path, encoding='utf8'))
+    with open(path, encoding='utf8') as f:
+        cfg = json.load(f)
     cfg['paths']['chat_output'] = os.path.normpath(cfg['paths']['chat_output'])
     return cfg
 
-def build_concat_file(cfg, convo):
-    chat = cfg['paths']['chat_output']
+def concat_path(path):
+    """`path` as an absolute file: URL quoted for a concat demuxer script."""
+    return "'file:" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+def build_concat_list(cfg, convo, first=1):
+    """
+    Returns the concat demuxer script for the frames of `convo`, numbered from
+    `first`. It is piped to ffmpeg on stdin, so frames are absolute file:
+    URLs; relative entries would otherwise resolve against the pipe.
+    """
+    # resolve and quote the directory once; the frame names need neither
+    chat = concat_path(cfg['paths']['chat_output'])[:-1] + os.sep
     lines = []
-    for i, ev in enumerate(convo,1):
-        img = os.path.join("..", chat, f"{i:03d}.png")
-        lines.append(f"file '{img}'\noutpoint {ev['duration']}")
-    lines.append(f"file '{img}'\noutpoint 0.04")
-    cf = os.path.join(chat, 'concat.txt')
-    open(cf,'w').write("\n".join(lines))
-    return cf
+    for i, ev in enumerate(convo, first):
+        img = f"{chat}{i:03d}.png'"
+        lines.append(f"file {img}\noutpoint {ev['duration']}")
+    lines.append(f"file {img}\noutpoint 0.04")
+    return "\n".join(lines)
 
-def compile_video(cfg, convo):
-    concat = build_concat_file(cfg, convo)
-    os.makedirs('output', exist_ok=True)
-    out    = cfg['paths']['ffmpeg_output']
-    w      = cfg['layout']['world_width']
+@lru_cache(maxsize=None)
+def pick_encoder():
+    """
+    Returns (encoder, args) for the fastest H.264 encoder usable here.
+    `ffmpeg -encoders` also lists hardware encoders whose device is missing,
+    so each listed candidate must get through a tiny test encode first.
+    """
+    listed = subprocess.run(['ffmpeg','-hide_banner','-encoders'],
+                            capture_output=True, text=True).stdout
+    for name, args in ENCODERS[:-1]:
+        if f" {name} " not in listed:
+            continue
+        probe = [
+          'ffmpeg','-hide_banner',
+          '-f','lavfi','-i','color=size=256x256:duration=0.1',
+          '-c:v',name,*args,'-f','null','-'
+        ]
+        if subprocess.run(probe, stdin=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0:
+            return name, args
+    return ENCODERS[-1]
+
+def video_filter(cfg):
+    """
+    Pads every frame to a world_width square. generate_chat renders every
+    frame at world_width already, so nothing is scaled; message frames are
+    an odd number of pixels tall and are padded, not stretched, to fit.
+    """
+    w = cfg['layout']['world_width']
+    return f"pad={w}:{w}:(ow-iw)/2:(oh-ih)/2"
+
+def encode_part(cfg, convo, first, out, frames, codec):
+    """
+    Encodes the first `frames` output frames of `convo`, numbered from
+    `first`, without audio. `codec` holds the encoder arguments.
+    """
     cmd = [
-      'ffmpeg','-f','concat','-safe','0','-i',concat,
-      '-vcodec','libx264','-r','25','-crf','25',
-      '-vf',f"scale={w}:-2,pad={w}:{w}:(ow-iw)/2:(oh-ih)/2",
-      '-pix_fmt','yuv420p', out
+      'ffmpeg','-y','-protocol_whitelist','file,pipe',
+      '-f','concat','-safe','0','-i','pipe:0',
+      '-vf', video_filter(cfg), '-frames:v', str(frames),
+      '-r',str(FPS), *codec, out
     ]
-    subprocess.run(cmd, check=True)
-    os.remove(concat)
+    subprocess.run(cmd, input=build_concat_list(cfg, convo, first).encode('utf8'), check=True)
+
+def run_ffmpeg(cmd, script, duration):
+    """
+    Runs ffmpeg with `script` on stdin, printing how far it has got through
+    `duration` seconds. The script is fed from a thread so ffmpeg can start
+    reading frames while its progress is being read here.
+    """
+    cmd  = [*cmd[:-1], '-nostats', '-progress', 'pipe:1', cmd[-1]]
+    # UTF-8 whatever the locale, as in encode_part, so non-ASCII paths survive
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding='utf-8')
+
+    def feed():
+        with proc.stdin:
+            proc.stdin.write(script)
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    for line in proc.stdout:
+        key, _, value = line.strip().partition('=')
+        if key == 'out_time_us' and value.isdigit() and duration:
+            done = min(100, int(value) // 10_000 / duration)
+            print(f"\rEncoding video: {done:3.0f}%", end='', flush=True)
+    print()
+    feeder.join()
+    if proc.wait():
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+def compile_video(cfg, convo):
+    """
+    Encodes the rendered frames and mixes in the sound effects and themes,
+    writing straight to the final video. Long conversations are cut into
+    parts that are encoded side by side and then joined without re-encoding;
+    short ones are encoded in the same ffmpeg pass that mixes the audio.
+    """
+    events   = collect_audio_events(cfg, convo)
+    out      = cfg['paths']['final_video']
+    duration = sum(float(ev['duration']) for ev in convo)
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+
+    # probed once here, not by every part's thread at the same time
+    encoder, encoder_args = pick_encoder()
+    codec = ['-vcodec', encoder, *encoder_args]
+    cpus  = os.cpu_count() or 1
+    n = min(cpus // 2, len(convo) // PART_MIN_EVENTS)
+    if encoder != 'libx264':
+        n = min(n, HW_MAX_PARTS)
+    parts = [os.path.join(cfg['paths']['chat_output'], f"part{k:02d}.mp4") for k in range(n)]
+    if n > 1:
+        bounds = [len(convo) * k // n for k in range(n + 1)]
+        # cut on whole frames of the overall timeline: rounding each part to
+        # the frame rate on its own would drift from the audio part by part
+        starts = list(accumulate((float(ev['duration']) for ev in convo), initial=0.0))
+        cuts   = [round(starts[b] * FPS) for b in bounds]
+        # libx264 threads over every core by default; give each part its share
+        part_codec = codec + ['-threads', str(cpus // n)] if encoder == 'libx264' else codec
+        with ThreadPoolExecutor(n) as pool:
+            for f in [pool.submit(encode_part, cfg, convo[a:b], a + 1, part, d - c, part_codec)
+                      for a, b, c, d, part in zip(bounds, bounds[1:], cuts, cuts[1:], parts)]:
+                f.result()
+        concat = "\n".join(f"file {concat_path(part)}" for part in parts)
+        maps   = ['-map', '0:v', '-c:v', 'copy']
+    else:
+        concat = build_concat_list(cfg, convo)
+        maps   = ['-map', '0:v', '-vf', video_filter(cfg), '-r', str(FPS), *codec]
+    try:
+        # the video keeps its own simple filter: sharing one filter_complex
+        # with the audio mix stalls ffmpeg on long conversations
+        with audio_filter_script(events, 1) as filter_args:
+            if events:
+                maps += [*filter_args, '-map', '[aout]', '-c:a', 'aac']
+            # sounds may ring on past the last event; stop where the frames do
+            cmd = [
+              'ffmpeg','-y','-protocol_whitelist','file,pipe',
+              '-f','concat','-safe','0','-i','pipe:0',
+              *audio_inputs(events), *maps, '-t', f"{duration:.3f}", out
+            ]
+            run_ffmpeg(cmd, concat, duration)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
 
 if __name__=='__main__':
-    import argparse, json
+    import argparse
     p = argparse.ArgumentParser()
     p.add_argument('config')
     p.add_argument('conversation')
     args = p.parse_args()
     cfg   = load_config(args.config)
-    convo = json.load(open(args.conversation, encoding='utf8'))
+    with open(args.conversation, encoding='utf8') as f:
+        convo = json.load(f)
     compile_video(cfg, convo)
@@ -5,51 +5,60 @@ import json
 import datetime
 import random
 import re
+from io import BytesIO
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from PIL import Image, ImageFont, ImageDraw
 from pilmoji import Pilmoji
+from pilmoji.source import BaseSource, Twemoji
+from pilmoji.helpers import EMOJI_REGEX, NodeType, to_nodes
 
 # ——— Markdown parsing ——————————————————————————————————————————————
 
+# one named group per kind; the match's lastgroup is the token's kind
 MD_RE = re.compile(
-    r"("
-    r"\`\`\`.*?\`\`\`|"                               # `monospace`
-    r"https?://\S+|"                                  # URL
-    r"\*\*\*.+?\*\*\*|"                               # ***bolditalic***
-    r"\*\*.+?\*\*|"                                   # **bold**
-    r"\*.+?\*|"                                       # *italic*
-    r"~.+?~|"                                         # ~strike~
-    r"@\w+|"                                          # @mention
-    r"#\w+|"                                          # #channel
-    r"[\U0001F300-\U0001FAFF\U00002600-\U000027BF]|"  # emoji range
-    r"[^\*\~@#`\s]+|\s+)"                             # text or whitespace
+    r"(?P<monospace>\`\`\`.*?\`\`\`)|"                           # `monospace`
+    r"(?P<link>https?://\S*)|"                                   # URL
+    r"(?P<bolditalic>\*\*\*.+?\*\*\*)|"                          # ***bolditalic***
+    r"(?P<bold>\*\*.+?\*\*)|"                                    # **bold**
+    r"(?P<italic>\*.+?\*)|"                                      # *italic*
+    r"(?P<strike>~.+?~)|"                                        # ~strike~
+    r"(?P<mention>@\w+)|"                                        # @mention
+    r"(?P<channel>#\w+)|"                                        # #channel
+    r"(?P<emoji>[\U0001F300-\U0001FAFF\U00002600-\U000027BF])|"  # emoji range
+    r"(?P<text>[^\*\~@#`\s]+|\s+)"                               # text or whitespace
 )
 
+# markers stripped from each end of a token, and kinds renamed from their group
+MD_MARKERS = {'monospace': 3, 'bolditalic': 3, 'bold': 2, 'italic': 1, 'strike': 1}
+MD_KINDS   = {'channel': 'channel mention'}
+
+# kinds drawn as plain text in message colour, and the font each one uses
+PLAIN_FONTS = {
+    'text':       'message',
+    'bold':       'message_bold',
+    'italic':     'message_italic',
+    'bolditalic': 'message_bold_italic',
+    'monospace':  'monospace',
+}
+
+@lru_cache(maxsize=4096)
 def parse_md(text):
-    toks = MD_RE.findall(text)
+    """
+    Splits a wrapped line into (kind, text) tokens. Every frame of a block
+    re-parses all of its earlier lines, so results are cached as tuples.
+    """
     parsed = []
-    for t in toks:
-        if t.startswith('```') and t.endswith('```'):
-            parsed.append(('monospace', t[3:-3]))
-        elif t.startswith('***') and t.endswith('***'):
-            parsed.append(('bolditalic', t[3:-3]))
-        elif t.startswith('**') and t.endswith('**'):
-            parsed.append(('bold', t[2:-2]))
-        elif t.startswith('*') and t.endswith('*'):
-            parsed.append(('italic', t[1:-1]))
-        elif t.startswith('~') and t.endswith('~'):
-            parsed.append(('strike', t[1:-1]))
-        elif t.startswith('@'):
-            parsed.append(('mention', t))
-        elif t.startswith('#'):
-            parsed.append(('channel mention', t))
-        elif t.startswith("http://") or t.startswith("https://"):
-            parsed.append(('link', t))
-        elif re.match(r"[\U0001F300-\U0001FAFF\U00002600-\U000027BF]", t):
-            parsed.append(('emoji', t))
-        else:
-            parsed.append(('text', t))
-    return parsed
+    for m in MD_RE.finditer(text):
+        kind, t = m.lastgroup, m.group()
+        if kind == 'text' and parsed and parsed[-1][0] == 'text':
+            # words and the spaces between them are drawn as one run
+            parsed[-1] = ('text', parsed[-1][1] + t)
+            continue
+        n = MD_MARKERS.get(kind, 0)
+        parsed.append((MD_KINDS.get(kind, kind), t[n:len(t)-n]))
+    return tuple(parsed)
 
 # ——— Utilities ——————————————————————————————————————————————————
 
@@ -57,49 +66,266 @@ def load_json(path):
     with open(path, encoding='utf8') as f:
         return json.load(f)
 
+# "h:MM AM" for every minute of the day; strftime's %-I is glibc-only
+CLOCK = tuple(f"{h % 12 or 12}:{m:02d} {'AM' if h < 12 else 'PM'}" for h in range(24) for m in range(60))
+
 def rgb(hexcol):
     h = hexcol.lstrip('#')
     return tuple(int(h[i:i+2],16) for i in (0,2,4))
 
+@lru_cache(maxsize=None)
+def load_icon(path, size):
+    """
+    Opens `path` as RGBA, shrunk to fit a size×size box. Cached, since the
+    same avatars, badges and arrows are pasted on frame after frame; callers
+    only paste the result and must not modify it.
+    """
+    img = Image.open(path).convert('RGBA')
+    img.thumbnail((size, size), Image.LANCZOS)
+    return img
+
+@lru_cache(maxsize=None)
+def circle_mask(size):
+    """An L-mode mask of the ellipse filling `size`, shared by every avatar."""
+    mask = Image.new('L', size, 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, *size), fill=255)
+    return mask
+
+@lru_cache(maxsize=None)
+def avatar(path, size, color):
+    """
+    The round profile picture already composited onto the `color`
+    background it always sits on, so a frame pastes it as a plain copy
+    with no per-pixel alpha blending.
+    """
+    pic = load_icon(path, size)
+    tile = Image.new('RGBA', pic.size, color)
+    tile.paste(pic, (0, 0), circle_mask(pic.size))
+    return tile
+
+@lru_cache(maxsize=None)
+def _background(width, color):
+    # a frame taller than it is wide won't fit the square video anyway
+    return Image.new('RGBA', (width, width), color)
+
+def blank_canvas(width, height, color):
+    """
+    A width×height RGBA canvas filled with `color`. Cropping it out of a
+    cached pre-filled strip is a plain copy, cheaper than filling anew.
+    """
+    strip = _background(width, color)
+    if height > strip.height:
+        return Image.new('RGBA', (width, height), color)
+    return strip.crop((0, 0, width, height))
+
+@lru_cache(maxsize=1024)
+def text_stamp(text, font, fill, bg):
+    """
+    `text` drawn once onto a tile of its plain `bg` colour, and how far above
+    the draw position the tile starts. Names and join/leave wording repeat on
+    many frames and always sit on plain background.
+    """
+    _, y0, x1, y1 = text_bbox(font, text)
+    oy = min(y0, 0)
+    tile = Image.new('RGBA', (max(x1, 1), max(y1 - oy, 1)), bg)
+    ImageDraw.Draw(tile).text((0, -oy), text, fill=fill, font=font)
+    return tile, oy
+
+def paste_text(canvas, xy, text, fill, font, bg):
+    """
+    Same pixels as draw.text onto a `bg`-coloured area, pasted from a cached
+    stamp. Text whose ink starts left of its origin could cover whatever was
+    drawn just before it, so that is still drawn directly.
+    """
+    if text_bbox(font, text)[0] < 0:
+        ImageDraw.Draw(canvas).text(xy, text, fill=fill, font=font)
+        return
+    tile, oy = text_stamp(text, font, fill, bg)
+    canvas.paste(tile, (int(xy[0]), int(xy[1]) + oy))
+
+@lru_cache(maxsize=256)
+def mention_pill(width, height, color):
+    """
+    The rounded background of a mention, drawn once per size so frames can
+    paste it. rounded_rectangle includes its end coordinates, hence the +1.
+    """
+    pill = Image.new('RGBA', (width + 1, height + 1), (0, 0, 0, 0))
+    ImageDraw.Draw(pill).rounded_rectangle((0, 0, width, height), radius=8, fill=color)
+    return pill
+
+@lru_cache(maxsize=None)
+def arrow_canvas(width, height, color, arrow_path, ax):
+    """Background of a join/leave line with its arrow already pasted."""
+    canvas = Image.new('RGBA', (width, height), color)
+    arrow = load_icon(arrow_path, 40)
+    canvas.paste(arrow, (ax, (height - arrow.height) // 2), arrow)
+    return canvas
+
+@lru_cache(maxsize=None)
+def load_font(path, size):
+    return ImageFont.truetype(path, size)
+
 def init_fonts(cfg):
+    """
+    Loads the layout fonts. Roles sharing a file and size (message and
+    message_strike, name and mention) get the same font object, so they
+    also share its measurement caches.
+    """
     fd = cfg['paths']['fonts_dir']
     fonts = {}
     for key,spec in cfg['layout']['fonts'].items():
-        fonts[key] = ImageFont.truetype(
-            os.path.join(fd, spec['file']),
-            spec['size']
-        )
+        fonts[key] = load_font(os.path.join(fd, spec['file']), spec['size'])
     return fonts
 
+@lru_cache(maxsize=8192)
+def text_bbox(font, text):
+    """font.getbbox(text), cached: names, timestamps and tokens repeat a lot."""
+    return font.getbbox(text)
+
+@lru_cache(maxsize=8192)
+def text_length(font, text):
+    """font.getlength(text), the pen advance, cached like text_bbox."""
+    return font.getlength(text)
+
+# downloaded emoji images, kept between runs
+EMOJI_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                               'text2beluga', 'emoji')
+
+class CachedEmojiSource(BaseSource):
+    """
+    Wraps a Pilmoji source so each emoji image is fetched once per process,
+    and once ever as long as EMOJI_CACHE_DIR holds on to it. Pilmoji's own
+    cache dies with the Pilmoji, which is opened per frame, so every frame
+    would otherwise download its emoji again.
+    """
+    def __init__(self, source=Twemoji, cache_dir=EMOJI_CACHE_DIR):
+        self.source    = source()
+        self.cache_dir = os.path.join(cache_dir, source.__name__)
+        self._emoji    = {}
+        self._discord  = {}
+
+    def _cached(self, cache, key, filename, fetch):
+        if key not in cache:
+            cache[key] = self._load(filename, lambda: fetch(key))
+        data = cache[key]
+        return BytesIO(data) if data else None
+
+    def _load(self, filename, fetch):
+        path = os.path.join(self.cache_dir, filename)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+        stream = fetch()
+        if not stream:
+            return None
+        data = stream.getvalue()
+        try:
+            # written aside and renamed, as pool workers may fetch the same emoji
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # an unwritable cache only means fetching again next run
+        return data
+
+    def get_emoji(self, emoji, /):
+        filename = '-'.join(f"{ord(c):x}" for c in emoji) + '.png'
+        return self._cached(self._emoji, emoji, filename, self.source.get_emoji)
+
+    def get_discord_emoji(self, id, /):
+        return self._cached(self._discord, int(id), f"discord-{int(id)}.png",
+                            self.source.get_discord_emoji)
+
+@lru_cache(maxsize=None)
+def emoji_source():
+    # created lazily so pool workers don't share a parent's HTTP session
+    return CachedEmojiSource()
+
+def prefetch_emoji(convo, workers=16):
+    """
+    Downloads every emoji the conversation uses into EMOJI_CACHE_DIR side by
+    side, instead of one at a time as frames first draw them. Uses its own
+    source, so render processes don't inherit this one's HTTP session.
+    """
+    wanted = {(node.type, node.content)
+              for ev in convo if ev.get('type') == 'message'
+              for line in to_nodes(ev['text']) for node in line
+              if node.type is not NodeType.text}
+    if not wanted:
+        return
+    source = CachedEmojiSource()
+
+    def fetch(node):
+        kind, content = node
+        try:
+            if kind is NodeType.emoji:
+                source.get_emoji(content)
+            else:
+                source.get_discord_emoji(content)
+        except Exception:
+            pass  # the frame that draws it will fetch it again and report
+
+    with ThreadPoolExecutor(min(workers, len(wanted))) as pool:
+        list(pool.map(fetch, wanted))
+
 # ——— Rendering functions ——————————————————————————————————————————————
+@lru_cache(maxsize=4096)
 def wrap_text(text, font, max_width):
+    """
+    Splits `text` into lines no wider than `max_width`. A block re-wraps all
+    of its earlier messages on every frame, so the result is cached and
+    returned as a tuple.
+    """
     if text.startswith('```') and text.endswith('```'):
-        return text.splitlines()
-        
-    words = text.split()
+        return tuple(text.splitlines())
+
+    # A line's width is the pen advance up to its last word plus that word's
+    # ink width, both summed from cached word measurements. The sum misses
+    # only kerning across the spaces, which grows with the font size, so a
+    # line within a tenth of an em per join of max_width is measured exactly.
+    space_adv = text_length(font, ' ')
+    slack     = font.size / 10
     lines = []
-    current = ""
-    for word in words:
-        test = f"{current} {word}".strip()
-        # measure width of the combined string
-        if font.getbbox(test)[2] <= max_width:
-            current = test
+    current, current_w, current_adv, joins = "", 0, 0, 0
+    for word in text.split():
+        word_w, word_adv = text_bbox(font, word)[2], text_length(font, word)
+        if current:
+            test     = f"{current} {word}"
+            test_w   = max(current_w, current_adv + space_adv + word_w)
+            test_adv = current_adv + space_adv + word_adv
+            joins   += 1
+            if abs(test_w - max_width) <= 1 + slack * joins:
+                test_w, test_adv, joins = font.getbbox(test)[2], font.getlength(test), 0
+        else:
+            test, test_w, test_adv, joins = word, word_w, word_adv, 0
+        if test_w <= max_width:
+            current, current_w, current_adv = test, test_w, test_adv
         else:
             lines.append(current)
-            current = word
+            current, current_w, current_adv, joins = word, word_w, word_adv, 0
     if current:
         lines.append(current)
-    return lines
+    return tuple(lines)
 
-def render_block(actor, lines, cfg, fonts, profpics, colors, badges, now):
+def render_block(actor, lines, cfg, fonts, profpics, colors, badges, now, edited=False):
     """
     Renders a cumulative block of messages for `actor`, with each message
-    wrapped to fit the world_width and canvas height adjusted.
+    wrapped to fit the world_width and canvas height adjusted. `edited` marks
+    the timestamp when the newest message is an edit.
     """
     L = cfg['layout']
     world_w = L['world_width']
     x0 = L['message']['x']
     max_text_w = world_w - x0 - 20
+    # colours as tuples once, not per token
+    text_color = tuple(L['message']['color'])
+    time_color = tuple(L['time']['color'])
+    mention_bg = tuple(L['name']['mention_bg'])
+    mention_fg = tuple(L['name']['mention_text'])
 
     # 1) wrap every logical line into sub-lines
     wrapped = []  # will hold (sublined_text, edited_flag)
@@ -122,165 +348,132 @@ def render_block(actor, lines, cfg, fonts, profpics, colors, badges, now):
     if height < min_h:
         height = min_h
 
-    canvas = Image.new('RGBA', (world_w, height), tuple(L['world_color']))
+    canvas = blank_canvas(world_w, height, tuple(L['world_color']))
     draw = ImageDraw.Draw(canvas)
 
     # paste profile picture
-    pic = Image.open(profpics[actor]).convert('RGBA')
-    pic.thumbnail((pic_size, pic_size), Image.LANCZOS)
-    mask = Image.new('L', pic.size, 0)
-    ImageDraw.Draw(mask).ellipse((0, 0, *pic.size), fill=255)
-    canvas.paste(pic, tuple(L['profpic']['position']), mask)
+    canvas.paste(avatar(profpics[actor], pic_size, tuple(L['world_color'])),
+                 tuple(L['profpic']['position']))
 
     # draw name + timestamp
         # — draw name —
     nx, ny = L['name']['pos']
-    draw.text((nx, ny), actor, fill=colors[actor], font=fonts['name'])
+    paste_text(canvas, (nx, ny), actor, colors[actor], fonts['name'], tuple(L['world_color']))
 
     # — load & draw badge (if defined) —
     badge_filename = badges[actor]
     badge_offset = 0
     if badge_filename:
-        badge_img = Image.open(badge_filename).convert('RGBA')
-        # resize to configured badge size
+        # resized to configured badge size
         size = L['badge']['size']
-        badge_img.thumbnail((size, size), Image.LANCZOS)
+        badge_img = load_icon(badge_filename, size)
 
         # position badge vertically centered on the name line
-        text_h = fonts['name'].getbbox(actor)[3]
+        text_h = text_bbox(fonts['name'], actor)[3]
         by = ny + (text_h - size + L['badge']['spacing']) // 2
-        bx = nx + fonts['name'].getbbox(actor)[2] + L['badge']['spacing']
+        bx = nx + text_bbox(fonts['name'], actor)[2] + L['badge']['spacing']
 
         canvas.paste(badge_img, (bx, by), badge_img)
         badge_offset = size + L['badge']['spacing']
 
     # — draw timestamp, shifted right by name width + badge_offset + spacing —
-    ts = now.strftime('%-I:%M %p')
-    tx = nx + fonts['name'].getbbox(actor)[2] + badge_offset + L['time']['spacing']
+    ts = CLOCK[now.hour * 60 + now.minute]
+    tx = nx + text_bbox(fonts['name'], actor)[2] + badge_offset + L['time']['spacing']
     draw.text((tx, ny + 10),
               f"Today at {ts}",
-              fill=tuple(L['time']['color']),
+              fill=time_color,
               font=fonts['time'])
 
     # ——— ADD: draw "(edited)" next to timestamp if flagged —————————————
-    global EDITED_FLAG
-    if EDITED_FLAG:
+    if edited:
         edited_txt = " (edited)"
-        width_ts = fonts['time'].getbbox(f"Today at {ts}")[2]
-        draw.text((tx + width_ts, ny+10), edited_txt, fill=tuple(L['time']['color']), font=fonts['time'])
+        width_ts = text_bbox(fonts['time'], f"Today at {ts}")[2]
+        draw.text((tx + width_ts, ny+10), edited_txt, fill=time_color, font=fonts['time'])
 
     # draw wrapped message lines
     y = L['message']['y']
-    with Pilmoji(canvas) as pil:
+    with Pilmoji(canvas, source=emoji_source(), cache=False) as pil:
+        def write(xy, txt, fill, font):
+            # only tokens holding an emoji need pilmoji; the rest skip its
+            # per-call parsing and go straight to ImageDraw. Plain ASCII can't
+            # hold one (bar Discord's <:name:id>), which spares the regex.
+            if (txt.isascii() and '<' not in txt) or not EMOJI_REGEX.search(txt):
+                draw.text(xy, txt, fill, font=font)
+            else:
+                pil.text(xy, txt, fill, font=font)
+
         for raw, was_edited in wrapped:
             x = x0
             for kind, txt in parse_md(raw):
-                if kind == 'text':
-                    pil.text((x, y), txt, tuple(L['message']['color']), font=fonts['message'])
-                    w = fonts['message'].getbbox(txt)[2]
-                elif kind == 'bold':
-                    pil.text((x, y), txt, tuple(L['message']['color']), font=fonts['message_bold'])
-                    w = fonts['message_bold'].getbbox(txt)[2]
-                elif kind == 'italic':
-                    pil.text((x, y), txt, tuple(L['message']['color']), font=fonts['message_italic'])
-                    w = fonts['message_italic'].getbbox(txt)[2]
-                elif kind == 'bolditalic':
-                    pil.text((x, y), txt, tuple(L['message']['color']), font=fonts['message_bold_italic'])
-                    w = fonts['message_bold_italic'].getbbox(txt)[2]
+                if kind in PLAIN_FONTS:
+                    font = fonts[PLAIN_FONTS[kind]]
+                    write((x, y), txt, text_color, font=font)
+                    w = text_bbox(font, txt)[2]
                 elif kind == 'strike':
-                    pil.text((x, y), txt, tuple(L['message']['color']), font=fonts['message_strike'])
+                    write((x, y), txt, text_color, font=fonts['message_strike'])
                     asc,_ = fonts['message_strike'].getmetrics()
                     mid = y + asc//1.4
-                    draw.line((x, mid, x + fonts['message_strike'].getbbox(txt)[2], mid), fill=tuple(L['message']['color']), width=2)
-                    w = fonts['message_strike'].getbbox(txt)[2]
+                    draw.line((x, mid, x + text_bbox(fonts['message_strike'], txt)[2], mid), fill=text_color, width=2)
+                    w = text_bbox(fonts['message_strike'], txt)[2]
                 elif kind == 'link':
                     underline_y = y + fonts['message'].getmetrics()[0] + 2
-                    pil.text((x, y), txt, (66, 135, 245), font=fonts['message'])  # blue color
-                    draw.line((x, underline_y, x + fonts['message'].getbbox(txt)[2], underline_y), fill=(66, 135, 245), width=1)
-                    w = fonts['message'].getbbox(txt)[2]
+                    write((x, y), txt, (66, 135, 245), font=fonts['message'])  # blue color
+                    draw.line((x, underline_y, x + text_bbox(fonts['message'], txt)[2], underline_y), fill=(66, 135, 245), width=1)
+                    w = text_bbox(fonts['message'], txt)[2]
                 elif kind == 'emoji':
-                    pil.text((x, y+5), txt + " ", tuple(L['message']['color']), font=fonts['message'])
-                    w = fonts['message'].getbbox(txt + " ")[2]
-                elif kind == 'monospace':
-                    pil.text((x, y), txt, tuple(L['message']['color']), font=fonts['monospace'])
-                    w = fonts['monospace'].getbbox(txt)[2]
+                    write((x, y+5), txt + " ", text_color, font=fonts['message'])
+                    w = text_bbox(fonts['message'], txt + " ")[2]
                 else:  # mention
                     pad = L['message']['mention_pad']
-                    w_txt = fonts['mention'].getbbox(txt)[2]
-                    bg = [x, y-pad//2, x + w_txt + pad, y + fonts['mention'].getbbox(txt)[3] + pad//2]
-                    draw.rounded_rectangle(bg, radius=8, fill=tuple(L['name']['mention_bg']))
-                    pil.text((x+pad/2, y), txt, tuple(L['name']['mention_text']), font=fonts['mention'])
+                    w_txt = text_bbox(fonts['mention'], txt)[2]
+                    h_txt = text_bbox(fonts['mention'], txt)[3]
+                    stamp = mention_pill(w_txt + pad, h_txt + pad//2 * 2, mention_bg)
+                    canvas.paste(stamp, (x, y - pad//2), stamp)
+                    write((x+pad/2, y), txt, mention_fg, font=fonts['mention'])
                     w = w_txt + pad
                 x += w
             if was_edited:
                 edit_str = " (edited)"
                 # x is already at end-of-line after drawing the last token
-                pil.text((x + 4, y),
-                         edit_str,
-                         tuple(L['message']['color']),
-                         font=fonts['message_italic'])
+                write((x + 4, y),
+                      edit_str,
+                      text_color,
+                      font=fonts['message_italic'])
 
             y += line_h
 
     return canvas
 
-def render_join(ev, cfg, fonts, colors, now):
-    """
-    Renders a join message with role-colored name.
-    """
-    L = cfg['layout']['joined']
-    canvas = Image.new('RGBA', (cfg['layout']['world_width'], L['height']), tuple(cfg['layout']['world_color']))
-    draw = ImageDraw.Draw(canvas)
-
-    # green arrow
-    arrow = Image.open(cfg['paths']['green_arrow']).convert('RGBA')
-    arrow.thumbnail((40,40), Image.LANCZOS)
-    ax = cfg['layout']['profpic']['position'][0]
-    ay = (L['height'] - arrow.height) // 2
-    canvas.paste(arrow, (ax, ay), arrow)
-
-    # split template around CHARACTER
-    template = random.choice(cfg['joined_texts'])
-    before, after = template.split("CHARACTER")
-    # draw before text
-    tx = ax + arrow.width + 20
-    draw.text((tx, ay), before, fill=tuple(L['color']), font=fonts['message'])
-    # draw name in role color
-    w_before = fonts['message'].getbbox(before)[2]
-    draw.text((tx + w_before, ay), ev['actor'], fill=colors[ev['actor']], font=fonts['name'])
-    # draw after
-    w_name = fonts['name'].getbbox(ev['actor'])[2]
-    draw.text((tx + w_before + w_name, ay), after, fill=tuple(L['color']), font=fonts['message'])
-
-    return canvas
-
-def render_leave(ev, cfg, fonts, colors, now):
+def render_notice(ev, cfg, fonts, colors, now, template):
     """
-    Renders a leave message with role-colored name.
+    Renders a join or leave message with role-colored name, worded by
+    `template`. Joins get the green arrow and the `joined` layout, leaves
+    the red arrow and the `left` layout.
     """
-    L = cfg['layout']['left']
-    canvas = Image.new('RGBA', (cfg['layout']['world_width'], L['height']), tuple(cfg['layout']['world_color']))
-    draw = ImageDraw.Draw(canvas)
-
-    # red arrow
-    arrow = Image.open(cfg['paths']['red_arrow']).convert('RGBA')
-    arrow.thumbnail((40,40), Image.LANCZOS)
+    join       = ev['type'] == 'join'
+    L          = cfg['layout']['joined' if join else 'left']
+    arrow_path = cfg['paths']['green_arrow' if join else 'red_arrow']
+    # arrow, pasted once onto a cached background
+    arrow = load_icon(arrow_path, 40)
     ax = cfg['layout']['profpic']['position'][0]
     ay = (L['height'] - arrow.height) // 2
-    canvas.paste(arrow, (ax, ay), arrow)
+    canvas = arrow_canvas(cfg['layout']['world_width'], L['height'],
+                          tuple(cfg['layout']['world_color']),
+                          arrow_path, ax).copy()
+    color = tuple(L['color'])
+    bg    = tuple(cfg['layout']['world_color'])
 
     # split template around CHARACTER
-    template = random.choice(cfg['left_texts'])
     before, after = template.split("CHARACTER")
     # draw before text
     tx = ax + arrow.width + 20
-    draw.text((tx, ay), before, fill=tuple(L['color']), font=fonts['message'])
+    paste_text(canvas, (tx, ay), before, color, fonts['message'], bg)
     # draw name in role color
-    w_before = fonts['message'].getbbox(before)[2]
-    draw.text((tx + w_before, ay), ev['actor'], fill=colors[ev['actor']], font=fonts['name'])
+    w_before = text_bbox(fonts['message'], before)[2]
+    paste_text(canvas, (tx + w_before, ay), ev['actor'], colors[ev['actor']], fonts['name'], bg)
     # draw after
-    w_name = fonts['name'].getbbox(ev['actor'])[2]
-    draw.text((tx + w_before + w_name, ay), after, fill=tuple(L['color']), font=fonts['message'])
+    w_name = text_bbox(fonts['name'], ev['actor'])[2]
+    paste_text(canvas, (tx + w_before + w_name, ay), after, color, fonts['message'], bg)
 
     return canvas
 
@@ -330,25 +523,18 @@ def render_attachments(canvas, attachments, cfg, fonts, start_y):
 
 # ——— Main with cumulative logic —————————————————————————————————————————
 
-def save_images(cfg, convo, chars):
-    out = cfg['paths']['chat_output']
-    os.makedirs(out, exist_ok=True)
-
-    fonts    = init_fonts(cfg)
-    profpics = {n: os.path.join(cfg['paths']['profile_pics'], c['profile_pic'])for n,c in chars.items()}
-    badges = {n: os.path.join(cfg['paths']['badges_dir'], c['badge']) if c['badge'] else None for n, c in chars.items()}
-    colors   = {n: rgb(c['role_color']) for n,c in chars.items()}
-
+def frame_tasks(cfg, convo):
+    """
+    Walks the conversation once, carrying the cumulative block, the clock and
+    the random join/leave wording, and yields a self-contained (index, kind,
+    args) task per frame so frames can be rendered in any order.
+    """
     now = datetime.datetime.now()
     current_actor = None
     current_lines = []
-    idx = 1
 
-    for ev in convo:
+    for idx, ev in enumerate(convo, 1):
         if ev['type'] == 'message':
-            global EDITED_FLAG
-            EDITED_FLAG = ev.get('edited', False)
-
             msg = {'text': ev['text'], 'edited': ev.get('edited', False)}
             if ev['actor'] == current_actor:
                 if msg['edited']:
@@ -359,28 +545,63 @@ def save_images(cfg, convo, chars):
                 current_actor = ev['actor']
                 current_lines = [msg]
 
-            img = render_block(current_actor, current_lines, cfg, fonts, profpics, colors, badges, now)
-            img.save(os.path.join(out, f"{idx:03d}.png"))
+            yield idx, 'message', (current_actor, list(current_lines), now, msg['edited'])
             now += datetime.timedelta(minutes=ev['duration'])
-            idx += 1
 
-            EDITED_FLAG = False
-
-        elif ev['type'] == 'join':
+        elif ev['type'] in ('join', 'leave'):
             current_actor = None
             current_lines = []
-            img = render_join(ev, cfg, fonts, colors, now)
-            img.save(os.path.join(out, f"{idx:03d}.png"))
+            texts = cfg['joined_texts' if ev['type'] == 'join' else 'left_texts']
+            yield idx, ev['type'], (ev, now, random.choice(texts))
             now += datetime.timedelta(seconds=ev['duration'])
-            idx += 1
 
-        elif ev['type'] == 'leave':
-            current_actor = None
-            current_lines = []
-            img = render_leave(ev, cfg, fonts, colors, now)
-            img.save(os.path.join(out, f"{idx:03d}.png"))
-            now += datetime.timedelta(seconds=ev['duration'])
-            idx += 1
+# fonts and character assets of the current process, set by init_renderer
+_renderer = {}
+
+def init_renderer(cfg, chars):
+    _renderer.update(
+        cfg      = cfg,
+        fonts    = init_fonts(cfg),
+        profpics = {n: os.path.join(cfg['paths']['profile_pics'], c['profile_pic']) for n,c in chars.items()},
+        badges   = {n: os.path.join(cfg['paths']['badges_dir'], c['badge']) if c['badge'] else None for n, c in chars.items()},
+        colors   = {n: rgb(c['role_color']) for n,c in chars.items()},
+    )
+
+def render_frame(task):
+    idx, kind, args = task
+    r = _renderer
+    if kind == 'message':
+        actor, lines, now, edited = args
+        img = render_block(actor, lines, r['cfg'], r['fonts'], r['profpics'], r['colors'], r['badges'], now, edited)
+    else:
+        ev, now, template = args
+        img = render_notice(ev, r['cfg'], r['fonts'], r['colors'], now, template)
+    # frames are only read back by ffmpeg, so favour speed over size
+    img.save(os.path.join(r['cfg']['paths']['chat_output'], f"{idx:03d}.png"), compress_level=1)
+
+def save_images(cfg, convo, chars, workers=None):
+    """
+    Renders every frame of the conversation into chat_output. Frames don't
+    depend on each other once frame_tasks has laid them out, so they are
+    spread over a process pool, in runs of consecutive frames to keep each
+    worker's wrap and glyph caches warm.
+    """
+    out = cfg['paths']['chat_output']
+    os.makedirs(out, exist_ok=True)
+
+    prefetch_emoji(convo)
+    tasks   = list(frame_tasks(cfg, convo))
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        init_renderer(cfg, chars)
+        for task in tasks:
+            render_frame(task)
+        return
+
+    chunk = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=init_renderer, initargs=(cfg, chars)) as pool:
+        for _ in pool.map(render_frame, tasks, chunksize=chunk):
+            pass
 
 
 if __name__ == '__main__':
@@ -3,35 +3,52 @@
 import os, sys, json, argparse
 
 def load_config(path):
-    return json.load(open(path, encoding='utf8'))
+    with open(path, encoding='utf8') as f:
+        return json.load(f)
+
+def list_files(directory):
+    """Names of the regular files in `directory`, read with a single scandir."""
+    try:
+        with os.scandir(directory) as it:
+            return frozenset(e.name for e in it if e.is_file())
+    except FileNotFoundError:
+        return frozenset()
+
+def check_message(idx, ev):
+    if 'text' not in ev or not ev['text']:
+        yield f"#{idx}: empty text"
+    if 'duration' not in ev:
+        yield f"#{idx}: missing duration"
+    else:
+        try:
+            float(ev['duration'])
+        except (TypeError, ValueError):
+            yield f"#{idx}: bad duration '{ev['duration']}'"
+
+def check_join(idx, ev):
+    if 'duration' not in ev:
+        yield f"#{idx}: missing duration for join"
+
+# type-specific checks; anything that isn't a message is checked like a join
+EVENT_CHECKS = {'message': check_message, 'join': check_join, 'leave': check_join}
 
 def validate(convo, config):
     errors = []
     codes = set(config['sound_codes'])
     sd = config['paths']['sound_dir']
+    available = list_files(sd)
     for idx, ev in enumerate(convo, 1):
-        if ev.get('type') not in ('join','leave','message'):
-            errors.append(f"#{idx}: bad type {ev.get('type')}")
+        kind = ev.get('type')
+        if kind not in EVENT_CHECKS:
+            errors.append(f"#{idx}: bad type {kind}")
         if 'actor' not in ev:
             errors.append(f"#{idx}: missing actor")
         if 'sound' not in ev or ev['sound'] not in codes:
             errors.append(f"#{idx}: invalid sound '{ev.get('sound')}'")
-        if ev['type']=='message':
-            if 'text' not in ev or not ev['text']:
-                errors.append(f"#{idx}: empty text")
-            if 'duration' not in ev:
-                errors.append(f"#{idx}: missing duration")
-            else:
-                try:
-                    float(ev['duration'])
-                except:
-                    errors.append(f"#{idx}: bad duration '{ev['duration']}'")
-        else:
-            if 'duration' not in ev:
-                errors.append(f"#{idx}: missing duration for join")
-        fn = os.path.join(sd, f"{ev['sound']}.mp3")
-        if not os.path.isfile(fn):
-            errors.append(f"#{idx}: file not found {fn}")
+        errors.extend(EVENT_CHECKS.get(kind, check_join)(idx, ev))
+        name = f"{ev.get('sound')}.mp3"
+        if name not in available:
+            errors.append(f"#{idx}: file not found {os.path.join(sd, name)}")
     return errors
 
 def main():
@@ -41,7 +58,8 @@ def main():
     args = p.parse_args()
 
     cfg = load_config(args.config)
-    convo = json.load(open(args.conversation, encoding='utf8'))
+    with open(args.conversation, encoding='utf8') as f:
+        convo = json.load(f)
     errs = validate(convo, cfg)
     if errs:
         print("Errors:")
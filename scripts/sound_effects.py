@@ -1,8 +1,14 @@
 # scripts/sound_effects.py
 
 #!/usr/bin/env python3
-import os, json, argparse
-from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip, concatenate_audioclips, afx
+import os, re, json, argparse, subprocess, tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import accumulate
+try:
+    from scripts.script_validator import list_files
+except ImportError:  # run directly as scripts/sound_effects.py
+    from script_validator import list_files
 
 def load_config(path):
     with open(path, encoding='utf8') as f:
@@ -19,25 +25,29 @@ def find_theme_change_indices(convo):
             current_theme += 1
     return theme_events
 
-def add_sounds_and_themes(cfg, convo, silent_video_path, final_video_path):
-    video = VideoFileClip(silent_video_path)
-    event_clips = []
-    theme_clips = []
+def collect_audio_events(cfg, convo):
+    """
+    Returns (path, start, loop_duration, volume) for every sound to mix in.
+    One-shot effects have loop_duration None and play out in full; theme
+    segments are looped and trimmed to the length of their segment.
+    """
+    events = []
 
     sound_dir = cfg['paths']['sound_dir']
     theme_dir = cfg['paths']['theme_dir']  # Assuming theme tracks also reside here
     themes = cfg.get('theme_codes', [])
-    total_duration = 0.0
+    # file name -> path, so membership and path building are one lookup
+    sound_paths = {name: os.path.join(sound_dir, name) for name in list_files(sound_dir)}
+    themes_available = list_files(theme_dir)
+    # starts[i] is when event i begins; starts[-1] is the total duration
+    starts = list(accumulate((float(ev['duration']) for ev in convo), initial=0.0))
 
     # Add sound effect clips
-    for event in convo:
-        dur = float(event['duration'])
+    for event, start in zip(convo, starts):
         sound_name = event.get('sound')
-        if sound_name:
-            sound_path = os.path.join(sound_dir, f"{sound_name}.mp3")
-            if os.path.isfile(sound_path):
-                event_clips.append(AudioFileClip(sound_path).set_start(total_duration))
-        total_duration += dur
+        sound_path = sound_name and sound_paths.get(f"{sound_name}.mp3")
+        if sound_path:
+            events.append((sound_path, start, None, 1.0))
 
     # Add background themes
     theme_points = find_theme_change_indices(convo)
@@ -50,22 +60,107 @@ def add_sounds_and_themes(cfg, convo, silent_video_path, final_video_path):
     for (start_idx, theme_idx), (end_idx, _) in zip(theme_points, theme_points[1:]):
         if theme_idx >= len(themes):
             break
-        segment_duration = sum(float(convo[i]['duration']) for i in range(start_idx, end_idx))
-        theme_file = os.path.join(theme_dir, f"{themes[theme_idx]}.mp3")
-        if os.path.isfile(theme_file):
-            theme_clip = AudioFileClip(theme_file)
-            theme_clip = afx.audio_loop(theme_clip, duration=segment_duration).volumex(0.15)
-            theme_clips.append(theme_clip.set_start(timeline))
+        segment_duration = starts[end_idx] - starts[start_idx]
+        theme_file = f"{themes[theme_idx]}.mp3"
+        if theme_file in themes_available:
+            events.append((os.path.join(theme_dir, theme_file), timeline, segment_duration, 0.15))
         timeline += segment_duration
 
-    # Mix all clips together
-    all_audio = event_clips + theme_clips
-    if all_audio:
-        video = video.set_audio(CompositeAudioClip(all_audio))
+    return events
+
+def audio_sources(events):
+    """
+    Groups `events` by the (path, loop_duration) input they read from, so
+    every distinct sound is opened and decoded by ffmpeg only once.
+    Returns {source: [event indices]} in input order.
+    """
+    sources = {}
+    for i, (path, _, loop_duration, _) in enumerate(events):
+        sources.setdefault((path, loop_duration), []).append(i)
+    return sources
+
+def audio_inputs(events):
+    """ffmpeg input arguments for `events`; looped inputs are cut to length."""
+    args = []
+    for path, loop_duration in audio_sources(events):
+        if loop_duration is not None:
+            args += ['-stream_loop', '-1', '-t', f"{loop_duration:.3f}"]
+        args += ['-i', path]
+    return args
+
+def audio_filter(events, first_input):
+    """
+    Builds a filter graph that delays every event to its start time and mixes
+    them into [aout]. Inputs are numbered from `first_input` in the order of
+    audio_sources(); a sound used several times is fanned out with asplit.
+    """
+    chains = []
+    for j, users in enumerate(audio_sources(events).values()):
+        src = f"[{first_input+j}:a]"
+        if len(users) > 1:
+            chains.append(src + f"asplit={len(users)}" + ''.join(f"[s{i}]" for i in users))
+            srcs = [f"[s{i}]" for i in users]
+        else:
+            srcs = [src]
+        for i, src in zip(users, srcs):
+            _, start, _, volume = events[i]
+            ops = []
+            if volume != 1.0:
+                ops.append(f"volume={volume}")
+            ops.append(f"adelay={int(start*1000)}:all=1")
+            chains.append(f"{src}{','.join(ops)}[a{i}]")
+    labels = ''.join(f"[a{i}]" for i in range(len(events)))
+    chains.append(f"{labels}amix=inputs={len(events)}:normalize=0[aout]")
+    return ';'.join(chains)
+
+@lru_cache(maxsize=None)
+def filter_script_option():
+    """
+    The ffmpeg option that reads a filter graph from a file. ffmpeg 7 takes
+    any option's value from a file with a '-/' prefix and deprecates
+    -filter_complex_script, which older builds need.
+    """
+    version = subprocess.run(['ffmpeg', '-hide_banner', '-version'],
+                             capture_output=True, text=True).stdout
+    m = re.match(r'ffmpeg version n?(\d+)\.', version)
+    return '-filter_complex_script' if m and int(m.group(1)) < 7 else '-/filter_complex'
+
+@contextmanager
+def audio_filter_script(events, first_input):
+    """
+    Writes audio_filter() to a temporary file for as long as the block runs
+    and yields the ffmpeg arguments that read it, or [] without events. The
+    graph grows by ~50 characters a sound, so in argv it would pass the
+    OS limit on long conversations (32K characters on Windows).
+    """
+    if not events:
+        yield []
+        return
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf8') as f:
+            f.write(audio_filter(events, first_input))
+        yield [filter_script_option(), path]
+    finally:
+        os.remove(path)
 
-    video.write_videofile(final_video_path, codec='libx264', audio_codec='aac',
-                          temp_audiofile='temp-audio.m4a', remove_temp=True)
-    video.close()
+def add_sounds_and_themes(cfg, convo, silent_video_path, final_video_path):
+    events = collect_audio_events(cfg, convo)
+
+    # Mix everything in a single ffmpeg pass; the video stream is copied as-is
+    with audio_filter_script(events, 1) as filter_args:
+        cmd = ['ffmpeg', '-y', '-i', silent_video_path]
+        if events:
+            cmd += audio_inputs(events) + filter_args + [
+              '-map', '0:v', '-map', '[aout]',
+              '-c:v', 'copy', '-c:a', 'aac',
+              # sounds may ring on past the last event; stop where the video does
+              '-t', f"{sum(float(ev['duration']) for ev in convo):.3f}"
+            ]
+        else:
+            cmd += ['-c', 'copy']
+        cmd.append(final_video_path)
+        subprocess.run(cmd, check=True)
 
 def main():
     parser = argparse.ArgumentParser()